@@ -1,21 +1,209 @@
 from mcp.server.fastmcp import FastMCP, Context
 
+import asyncio
+import base64
+import json
 import logging
-from dataclasses import dataclass
-from contextlib import asynccontextmanager
-from typing import AsyncIterator, Dict, Any, List
+import queue
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, Any, List, Tuple
 import os
+import socket
 import sys
 
+import numpy as np
+
+# orjson is an optional fast path: a C encoder that writes bytes directly and
+# serializes NumPy arrays natively, so snapshots skip the intermediate Python
+# list of floats. Install via the "perf" extra.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# numba is an optional fast path for the windowed fleet kernels; without it
+# they fall back to vectorized NumPy reductions. Install via the "perf" extra.
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
 if 'SUMO_HOME' in os.environ:
     sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
 
-import traci
+# libsumo exposes the same API as traci but drives the simulator in-process,
+# skipping the TCP round-trip every getter otherwise pays. Opt in with
+# SUMO_USE_LIBSUMO=1 when SUMO is co-located; the network traci path stays
+# the default so remote SUMO servers keep working.
+_USE_LIBSUMO = os.environ.get("SUMO_USE_LIBSUMO") == "1"
+if _USE_LIBSUMO:
+    try:
+        import libsumo as traci
+        from libsumo import constants as tc
+    except ImportError:
+        _USE_LIBSUMO = False
+        import traci
+        import traci.constants as tc
+else:
+    import traci
+    import traci.constants as tc
+
+SUMO_CONFIG = os.environ.get("SUMO_CONFIG", "your_sumo_config_file.sumocfg")
+# When the config is given explicitly and the target host is local, connect()
+# launches SUMO next to the server instead of dialing a remote endpoint.
+# Neither SUMO nor traci speaks AF_UNIX, so co-location over loopback (with
+# the socket tuning below) is the closest local-first transport.
+_LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+_OWN_SUMO = "SUMO_CONFIG" in os.environ
+# A TraCI server accepts one client unless started with --num-clients, so the
+# pool defaults to a single pre-warmed connection.
+POOL_SIZE = int(os.environ.get("SUMO_POOL_SIZE", "1"))
+# Number of buffered fleet snapshots used by the windowed analysis tools.
+HISTORY_WINDOW = int(os.environ.get("SUMO_HISTORY_WINDOW", "10"))
+# Capacity of the preallocated telemetry ring buffer, in vehicle slots.
+MAX_VEHICLES = int(os.environ.get("SUMO_MAX_VEHICLES", "4096"))
+# Bound on the per-connection table of vehicle-specialized reader closures.
+MAX_SPECIALIZED_READERS = 1024
+
+# Variable IDs bound once at import time so the hot path never repeats the
+# attribute walk through the constants module.
+VAR_SPEED = tc.VAR_SPEED
+VAR_POSITION = tc.VAR_POSITION
+VAR_ACCELERATION = tc.VAR_ACCELERATION
+VAR_LANE_ID = tc.VAR_LANE_ID
+VAR_EDGES = tc.VAR_EDGES
+VAR_ROUTE_ID = tc.VAR_ROUTE_ID
+
+# Variables kept up to date through a single TraCI subscription per vehicle,
+# so the per-vehicle getters below are served from the subscription cache
+# instead of one socket round-trip each.
+_VEHICLE_VARS = (
+    VAR_SPEED,
+    VAR_POSITION,
+    VAR_ACCELERATION,
+    VAR_LANE_ID,
+    VAR_EDGES,
+    VAR_ROUTE_ID,
+)
 
-logging.basicConfig(level=logging.INFO, 
+logging.basicConfig(level=logging.WARNING,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+def _anomaly_mask_numpy(pos_x, speed, eps, eta):
+    """Flag vehicles whose x-extent stayed within eps and peak speed under eta.
+
+    Both arrays are (N, K) windows: N vehicles by K buffered snapshots.
+    """
+    span = pos_x.max(axis=1) - pos_x.min(axis=1)
+    return (span <= eps) & (speed.max(axis=1) <= eta)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _anomaly_mask(pos_x, speed, eps, eta):
+        n = pos_x.shape[0]
+        out = np.zeros(n, np.bool_)
+        for i in prange(n):
+            out[i] = (pos_x[i].max() - pos_x[i].min()) <= eps \
+                and speed[i].max() <= eta
+        return out
+else:
+    _anomaly_mask = _anomaly_mask_numpy
+
+
+class FleetHistory:
+    """Preallocated SoA ring buffer of per-vehicle telemetry windows.
+
+    One contiguous float32 block of shape (max_vehicles, window, 4) holds
+    x, y, speed and acceleration per integer vehicle slot. IDs map to slots
+    through a dict and slots are recycled via an alive bitmap when vehicles
+    leave, so recording a tick writes straight into preallocated memory and
+    windowed reductions run over contiguous arrays instead of per-vehicle
+    dicts of lists.
+    """
+
+    X, Y, SPEED, ACCEL = range(4)
+
+    def __init__(self, max_vehicles: int = MAX_VEHICLES,
+                 window: int = HISTORY_WINDOW):
+        self.window = window
+        self._data = np.zeros((max_vehicles, window, 4), dtype=np.float32)
+        self._filled = np.zeros(max_vehicles, dtype=np.int32)
+        self._alive = np.zeros(max_vehicles, dtype=bool)
+        self._slots: Dict[str, int] = {}
+        self._free = list(range(max_vehicles - 1, -1, -1))
+        self._head = 0
+        self._ticks = 0
+
+    def record(self, ids, positions_xy, speed, accel):
+        """Write one simulation tick into the ring."""
+        head = self._head
+        seen = set(ids)
+        for vid in [v for v in self._slots if v not in seen]:
+            slot = self._slots.pop(vid)
+            self._alive[slot] = False
+            self._filled[slot] = 0
+            self._free.append(slot)
+        for i, vid in enumerate(ids):
+            slot = self._slots.get(vid)
+            if slot is None:
+                if not self._free:
+                    # Ring at capacity: drop overflow vehicles this tick.
+                    continue
+                slot = self._free.pop()
+                self._slots[vid] = slot
+                self._alive[slot] = True
+                self._filled[slot] = 0
+            row = self._data[slot, head]
+            row[self.X] = positions_xy[i, 0]
+            row[self.Y] = positions_xy[i, 1]
+            row[self.SPEED] = speed[i]
+            row[self.ACCEL] = accel[i]
+        np.minimum(self._filled + self._alive, self.window, out=self._filled,
+                   where=self._alive)
+        self._head = (head + 1) % self.window
+        self._ticks += 1
+
+    def windows(self):
+        """Gather (ids, pos_x, speed, depth) windows over the buffered ticks.
+
+        Only vehicles recorded for the full current depth (the number of
+        ticks buffered so far, capped at the window size) are returned.
+        """
+        k = min(self._ticks, self.window)
+        picked = [(vid, slot) for vid, slot in self._slots.items()
+                  if self._filled[slot] >= k]
+        if not picked or k == 0:
+            empty = np.empty((0, k), dtype=np.float32)
+            return [], empty, empty, k
+        vids = [vid for vid, _ in picked]
+        slots = np.fromiter((slot for _, slot in picked),
+                            dtype=np.int64, count=len(picked))
+        cols = (self._head - k + np.arange(k)) % self.window
+        block = self._data[slots[:, None], cols[None, :]]
+        return vids, block[:, :, self.X], block[:, :, self.SPEED], k
+
+
 logger = logging.getLogger("SUMOMCPServer")
+# Pre-bound to skip the attribute lookup in the hot getters.
+_debug = logger.debug
+
+# The connection checked out of the pool for the current context. A
+# ContextVar instead of a mutable module global: each acquire scope sees its
+# own binding, so nothing contends on (or accidentally rebinds) shared state.
+_conn_var: ContextVar["SUMOConnection"] = ContextVar("sumo_conn")
+
+
+def current_connection() -> "SUMOConnection":
+    """Return the SUMOConnection bound to the current context."""
+    conn = _conn_var.get(None)
+    if conn is None:
+        raise RuntimeError("No SUMO connection bound to this context")
+    return conn
 
 @dataclass
 class SUMOConnection:
@@ -23,17 +211,65 @@ class SUMOConnection:
     name: str
     host: str
     port: int
+    _sub_cache: Dict[str, Dict[int, Any]] = field(default_factory=dict, repr=False)
+    _step: float = field(default=-1.0, repr=False)
+    _step_cache: Dict[tuple, Any] = field(default_factory=dict, repr=False)
+    _history: "FleetHistory" = field(default_factory=lambda: FleetHistory(),
+                                     repr=False)
+    _readers: Dict[tuple, Any] = field(default_factory=dict, repr=False)
+    _hist_step: float = field(default=-1.0, repr=False)
+
+    def __post_init__(self):
+        # Bound method references, taken once so the hot getters skip the
+        # traci.vehicle attribute-lookup chain on every call.
+        self._getIDList = traci.vehicle.getIDList
+        self._getSpeed = traci.vehicle.getSpeed
+        self._getPosition = traci.vehicle.getPosition
+        self._getAcceleration = traci.vehicle.getAcceleration
+        self._getLaneID = traci.vehicle.getLaneID
+        self._getRoute = traci.vehicle.getRoute
+        self._getRouteID = traci.vehicle.getRouteID
+        self._subscribe = traci.vehicle.subscribe
+        self._getSubscriptionResults = traci.vehicle.getSubscriptionResults
+        self._getAllSubscriptionResults = traci.vehicle.getAllSubscriptionResults
+        self._getTime = traci.simulation.getTime
 
     def connect(self):
         """Establish a connection to the SUMO server."""
         logger.info(f"Connecting to SUMO server {self.name} at {self.host}:{self.port}")
         try:
-            traci.connect(host=self.host, port=self.port)
+            if _USE_LIBSUMO:
+                # In-process simulation: there is no socket to connect to.
+                traci.start(["sumo", "-c", SUMO_CONFIG])
+            elif self.host in _LOCAL_HOSTS and _OWN_SUMO:
+                # Co-located SUMO spawned by the server; getters only ever
+                # cross loopback, never a remote network hop.
+                traci.start(["sumo", "-c", SUMO_CONFIG], label=self.name)
+                self._tune_socket()
+            else:
+                traci.connect(host=self.host, port=self.port, label=self.name)
+                self._tune_socket()
             logger.info(f"Connected to SUMO server {self.name}")
         except Exception as e:
             logger.error(f"Failed to connect to SUMO server {self.name}: {e}")
             raise
 
+    def _tune_socket(self):
+        """Disable Nagle and widen the kernel buffers on the TraCI socket.
+
+        TraCI exchanges small request/response frames; Nagle's algorithm can
+        hold a request back waiting to coalesce it, which shows up directly
+        as tail latency on every getter. Best-effort: the socket is a
+        private traci internal, so failures only log a warning.
+        """
+        try:
+            sock = traci.getConnection(self.name)._socket
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        except Exception as e:
+            logger.warning(f"Could not tune TraCI socket for {self.name}: {e}")
+
     def disconnect(self):
         """Disconnect from the SUMO server."""
         logger.info(f"Disconnecting from SUMO server {self.name}")
@@ -44,87 +280,349 @@ class SUMOConnection:
             logger.error(f"Failed to disconnect from SUMO server {self.name}: {e}")
             raise
 
-    def get_vehicles(self) -> List[str]:
-        """Get the list of vehicles from the SUMO server."""
-        try:
-            vehicles = traci.vehicle.getIDList()
-            logger.info(f"Retrieved vehicles: {vehicles}")
-            return vehicles
-        except Exception as e:
-            logger.error(f"Failed to get vehicles from SUMO server: {e}")
-            raise
-    def get_vehicle_speed(self, vehicle_id: str) -> float:
-        """Get the speed of a specific vehicle."""
-        try:
-            speed = traci.vehicle.getSpeed(vehicle_id)
-            logger.info(f"Retrieved speed for vehicle {vehicle_id}: {speed}")
-            return speed
-        except Exception as e:
-            logger.error(f"Failed to get speed for vehicle {vehicle_id}: {e}")
-            raise
-    def get_vehicle_position(self, vehicle_id: str) -> List[float]:
-        """Get the position of a specific vehicle."""
+    def refresh_subscriptions(self):
+        """Pull all pending subscription results in one round-trip.
+
+        Call this once after every `traci.simulationStep()`; every
+        subscribed variable for every vehicle arrives in a single response.
+        """
         try:
-            position = traci.vehicle.getPosition(vehicle_id)
-            logger.info(f"Retrieved position for vehicle {vehicle_id}: {position}")
-            return position
+            # In-place update: specialized readers hold a reference to this
+            # dict, so it must never be rebound.
+            self._sub_cache.clear()
+            self._sub_cache.update(self._getAllSubscriptionResults())
         except Exception as e:
-            logger.error(f"Failed to get position for vehicle {vehicle_id}: {e}")
+            logger.error(f"Failed to refresh subscription results: {e}")
             raise
-    def get_vehicle_acceleration(self, vehicle_id: str) -> float:
-        """Get the acceleration of a specific vehicle."""
+
+    def _sync_step(self):
+        """Clear the per-step caches when the simulation clock has advanced.
+
+        Getter results are immutable within a tick, so invalidation is keyed
+        on explicit simulation stepping rather than wall-clock time.
+        """
+        step = self._getTime()
+        if step != self._step:
+            self._step = step
+            self._step_cache.clear()
+            self._sub_cache.clear()
+
+    def _cached(self, key: tuple, fetch, *args):
+        """Memoize a direct getter result for the current simulation step.
+
+        Callers must run `_sync_step()` first so a stale tick never serves.
+        """
+        if key not in self._step_cache:
+            self._step_cache[key] = fetch(*args)
+        return self._step_cache[key]
+
+    def _specialize(self, vehicle_id: str, var_id: int, label: str,
+                    fallback_attr: str):
+        """Build a reader closure pre-bound to one vehicle and variable.
+
+        UI-style pollers hit the same vehicle_id every tick; freezing the
+        cache references and fallback getter into a closure lets repeat
+        calls skip re-resolving them. The table is bounded (oldest entry
+        dropped at capacity) and entries are evicted when a vehicle leaves.
+        """
+        sub_cache = self._sub_cache
+        fallback = getattr(self, fallback_attr)
+        cached = self._cached
+        step_key = (vehicle_id, label)
+
+        def reader():
+            results = sub_cache.get(vehicle_id)
+            if results is None:
+                self._subscribe(vehicle_id, _VEHICLE_VARS)
+                results = self._getSubscriptionResults(vehicle_id)
+                if results:
+                    sub_cache[vehicle_id] = results
+            if results:
+                value = results.get(var_id)
+                if value is not None:
+                    return value
+            return cached(step_key, fallback, vehicle_id)
+
+        if len(self._readers) >= MAX_SPECIALIZED_READERS:
+            self._readers.pop(next(iter(self._readers)))
+        self._readers[(vehicle_id, var_id)] = reader
+        return reader
+
+    def get_fleet_snapshot(self) -> Dict[str, Any]:
+        """Snapshot speed/position/acceleration for the whole fleet.
+
+        One subscription sweep replaces O(N) per-vehicle round-trips, and
+        the struct-of-arrays layout hands downstream consumers contiguous
+        float32 arrays instead of per-vehicle Python objects.
+        """
         try:
-            acceleration = traci.vehicle.getAcceleration(vehicle_id)
-            logger.info(f"Retrieved acceleration for vehicle {vehicle_id}: {acceleration}")
-            return acceleration
+            self._sync_step()
+            ids = list(self._cached(("ids",), self._getIDList))
+            if self._readers:
+                seen = set(ids)
+                for key in [k for k in self._readers if k[0] not in seen]:
+                    del self._readers[key]
+            for vid in ids:
+                if vid not in self._sub_cache:
+                    self._subscribe(vid, _VEHICLE_VARS)
+                    results = self._getSubscriptionResults(vid)
+                    if results:
+                        self._sub_cache[vid] = results
+            n = len(ids)
+            speed = np.empty(n, dtype=np.float32)
+            accel = np.empty(n, dtype=np.float32)
+            # Positions live in one packed (N, 2) block; x/y are zero-copy
+            # views into it, and vectorized consumers (bounding boxes,
+            # congestion checks) get a single contiguous buffer.
+            positions_xy = np.empty((n, 2), dtype=np.float32)
+            for i, vid in enumerate(ids):
+                results = self._sub_cache.get(vid)
+                if results and VAR_SPEED in results:
+                    speed[i] = results[VAR_SPEED]
+                    accel[i] = results[VAR_ACCELERATION]
+                    positions_xy[i] = results[VAR_POSITION]
+                else:
+                    speed[i] = self._getSpeed(vid)
+                    accel[i] = self._getAcceleration(vid)
+                    positions_xy[i] = self._getPosition(vid)
+            _debug("fleet snapshot n=%d", n)
+            snapshot = {"ids": ids, "speed": speed,
+                        "positions_xy": positions_xy,
+                        "x": positions_xy[:, 0], "y": positions_xy[:, 1],
+                        "accel": accel}
+            # One history entry per simulation tick, however often polled.
+            if self._step != self._hist_step:
+                self._hist_step = self._step
+                self._history.record(ids, positions_xy, speed, accel)
+            return snapshot
         except Exception as e:
-            logger.error(f"Failed to get acceleration for vehicle {vehicle_id}: {e}")
+            logger.error(f"Failed to get fleet snapshot: {e}")
             raise
-    def get_vehicle_lane(self, vehicle_id: str) -> str:
-        """Get the lane of a specific vehicle."""
+
+    def detect_congestion(self, eps: float = 1.0, eta: float = 0.5) -> Dict[str, Any]:
+        """Flag vehicles that barely moved and stayed slow over the window.
+
+        A vehicle counts as congested when, across the buffered ticks,
+        its x-extent stays within `eps` metres and its peak speed stays
+        under `eta` m/s. Only vehicles recorded for the full buffered
+        depth are considered.
+        """
+        self.get_fleet_snapshot()
+        vids, pos_x, speed, k = self._history.windows()
+        if vids:
+            mask = _anomaly_mask(pos_x, speed, eps, eta)
+            congested = [vid for vid, flag in zip(vids, mask) if flag]
+        else:
+            congested = []
+        _debug("congestion window=%d flagged=%d", k, len(congested))
+        return {"congested": congested, "window": k}
+
+    def get_vehicles(self) -> List[str]:
+        """Get the list of vehicles from the SUMO server."""
         try:
-            lane = traci.vehicle.getLaneID(vehicle_id)
-            logger.info(f"Retrieved lane for vehicle {vehicle_id}: {lane}")
-            return lane
+            self._sync_step()
+            vehicles = self._cached(("ids",), self._getIDList)
+            _debug("vehicles=%s", vehicles)
+            return vehicles
         except Exception as e:
-            logger.error(f"Failed to get lane for vehicle {vehicle_id}: {e}")
+            logger.error(f"Failed to get vehicles from SUMO server: {e}")
             raise
-    def get_vehicle_route(self, vehicle_id: str) -> List[str]:
-        """Get the route of a specific vehicle."""
+
+def _make_vehicle_getter(label: str, var_id: int, fallback_attr: str, doc: str):
+    """Build a `SUMOConnection` getter for one subscribed vehicle variable.
+
+    All six per-vehicle getters share the same cache-then-fallback shape;
+    generating them from a table keeps the success path down to the cache
+    lookup itself, with no per-call scaffolding to maintain in six places.
+    """
+    def getter(self, vehicle_id: str):
+        self._sync_step()
+        reader = self._readers.get((vehicle_id, var_id))
+        if reader is None:
+            reader = self._specialize(vehicle_id, var_id, label, fallback_attr)
+        value = reader()
+        _debug("%s %s=%s", label, vehicle_id, value)
+        return value
+    getter.__name__ = f"get_vehicle_{label}"
+    getter.__doc__ = doc
+    return getter
+
+
+# (label, subscription variable, pre-bound fallback getter, docstring)
+_VEHICLE_GETTERS = (
+    ("speed", VAR_SPEED, "_getSpeed",
+     "Get the speed of a specific vehicle."),
+    ("position", VAR_POSITION, "_getPosition",
+     "Get the position of a specific vehicle."),
+    ("acceleration", VAR_ACCELERATION, "_getAcceleration",
+     "Get the acceleration of a specific vehicle."),
+    ("lane", VAR_LANE_ID, "_getLaneID",
+     "Get the lane of a specific vehicle."),
+    ("route", VAR_EDGES, "_getRoute",
+     "Get the route of a specific vehicle."),
+    ("route_edges", VAR_ROUTE_ID, "_getRouteID",
+     "Get the route edges of a specific vehicle."),
+)
+
+for _label, _var_id, _attr, _doc in _VEHICLE_GETTERS:
+    setattr(SUMOConnection, f"get_vehicle_{_label}",
+            _make_vehicle_getter(_label, _var_id, _attr, _doc))
+
+
+class SUMOConnectionPool:
+    """Bounded pool of pre-warmed, label-tagged TraCI connections.
+
+    Connections are established once at server startup so tool calls never
+    pay TCP handshake + SUMO init on the hot path. `acquire()` binds the
+    connection's label to the caller via `traci.switch()` and returns it to
+    the pool on exit.
+    """
+
+    def __init__(self, size: int, host: str = "localhost", port: int = 8813):
+        self.size = size
+        self.host = host
+        self.port = port
+        self._idle: queue.Queue = queue.Queue(maxsize=size)
+        self._opened = 0
+        self._open_lock = threading.Lock()
+
+    def open(self):
+        """Pre-warm the pooled connections.
+
+        Safe to call again after a partial or failed attempt (e.g. SUMO was
+        not up yet at server startup): only the missing connections are
+        established, and already-opened ones are kept.
+        """
+        with self._open_lock:
+            while self._opened < self.size:
+                conn = SUMOConnection(name=f"conn{self._opened}",
+                                      host=self.host, port=self.port)
+                conn.connect()
+                self._idle.put(conn)
+                self._opened += 1
+
+    def close(self):
+        """Disconnect every pooled connection."""
+        with self._open_lock:
+            while not self._idle.empty():
+                conn = self._idle.get_nowait()
+                try:
+                    if not _USE_LIBSUMO:
+                        traci.switch(conn.name)
+                    conn.disconnect()
+                except Exception as e:
+                    logger.error(f"Failed to close pooled connection {conn.name}: {e}")
+            self._opened = 0
+
+    @contextmanager
+    def acquire(self):
+        """Check out a connection, switching TraCI to its label."""
+        if self._opened == 0:
+            # Startup tolerated SUMO being down; retry now so the caller
+            # gets a clean connect error instead of blocking forever on an
+            # empty queue.
+            self.open()
+        conn = self._idle.get()
+        token = _conn_var.set(conn)
         try:
-            route = traci.vehicle.getRoute(vehicle_id)
-            logger.info(f"Retrieved route for vehicle {vehicle_id}: {route}")
-            return route
-        except Exception as e:
-            logger.error(f"Failed to get route for vehicle {vehicle_id}: {e}")
-            raise
-    def get_vehicle_route_edges(self, vehicle_id: str) -> List[str]:
-        """Get the route edges of a specific vehicle."""
+            if not _USE_LIBSUMO:
+                traci.switch(conn.name)
+            yield conn
+        finally:
+            _conn_var.reset(token)
+            self._idle.put(conn)
+
+
+# TraCI is a single serial socket, so concurrent tool calls would serialize
+# there anyway. Instead, pending getter requests are queued and a single
+# worker drains them in coalesced batches, amortizing protocol framing over
+# up to MAX_BATCH_SIZE requests per BATCH_INTERVAL_MS window.
+BATCH_INTERVAL_MS = 10
+MAX_BATCH_SIZE = 64
+
+_request_queue: asyncio.Queue = None
+
+# TraCI is serial, so one dedicated thread serves every blocking call; the
+# event loop never stalls on a socket round-trip while other tool calls wait.
+_traci_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="traci")
+
+
+def _run_batch(batch):
+    """Execute a batch of getter calls on the TraCI thread.
+
+    Returns (ok, value) pairs rather than touching the asyncio futures:
+    those are not thread-safe and are resolved back on the event loop.
+    """
+    outcomes = []
+    with get_sumo_connection():
+        sumo = current_connection()
+        for method, args, _ in batch:
+            try:
+                outcomes.append((True, getattr(sumo, method)(*args)))
+            except Exception as e:
+                outcomes.append((False, e))
+    return outcomes
+
+
+async def _traci_batch_worker():
+    """Drain queued getter requests and serve each batch off one connection."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _request_queue.get()]
+        deadline = loop.time() + BATCH_INTERVAL_MS / 1000.0
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_request_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
         try:
-            route_edges = traci.vehicle.getRouteID(vehicle_id)
-            logger.info(f"Retrieved route edges for vehicle {vehicle_id}: {route_edges}")
-            return route_edges
+            outcomes = await loop.run_in_executor(_traci_executor, _run_batch, batch)
         except Exception as e:
-            logger.error(f"Failed to get route edges for vehicle {vehicle_id}: {e}")
-            raise
-            
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        for (_, _, future), (ok, value) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+async def _submit(method: str, *args) -> Any:
+    """Queue a getter call for the batch worker and await its result."""
+    future = asyncio.get_running_loop().create_future()
+    await _request_queue.put((method, args, future))
+    return await future
+
 
 @asynccontextmanager
 async def server_lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
     """Lifespan context manager for the FastMCP server."""
+    global _request_queue, _sumo_pool
+    worker = None
     try:
         logger.info("Starting FastMCP server")
         try:
-            sumo = get_sumo_connection()
+            _sumo_pool = SUMOConnectionPool(size=POOL_SIZE)
+            _sumo_pool.open()
             logger.info("Sucessfully connected to SUMO server")
         except Exception as e:
             logger.error(f"Failed to connect to SUMO server: {e}")
+        _request_queue = asyncio.Queue()
+        worker = asyncio.create_task(_traci_batch_worker())
         yield {}
     finally:
-            global _sumo_connection
-            if _sumo_connection:
+            if worker is not None:
+                worker.cancel()
+            if _sumo_pool is not None:
                 logger.info("Disconnecting from SUMO on shutdown")
-                _sumo_connection.disconnect()
+                _sumo_pool.close()
             logger.info("SUMOMCP server shut down")
 
 mcp = FastMCP(
@@ -133,119 +631,114 @@ mcp = FastMCP(
     lifespan=server_lifespan
 )
 
-_sumo_connection = None
+_sumo_pool = None
 
 def get_sumo_connection():
-    """Get the SUMO connection."""
-    global _sumo_connection
-    if _sumo_connection is None:
-        try:
-            _sumo_connection = SUMOConnection(name="SUMO", host="localhost", port=8813)
-            _sumo_connection.connect()
-            logger.info("Connected to SUMO server")
-        except Exception as e:
-            logger.error(f"Failed to connect to SUMO server: {e}")
-            raise
-    else:
-        try:
-            traci.start(["sumo", "-c", "your_sumo_config_file.sumocfg"])
-            logger.info("SUMO started successfully")
-        except Exception as e:
-            logger.error(f"Failed to start SUMO: {e}")
-            raise
-    return _sumo_connection
+    """Acquire a pooled SUMO connection; use as a context manager."""
+    if _sumo_pool is None:
+        raise RuntimeError("SUMO connection pool is not initialized")
+    return _sumo_pool.acquire()
 
 @mcp.tool()
-def get_vehicles(ctx: Context) -> List[str]:
+async def get_vehicles(ctx: Context) -> List[str]:
     """Get the list of vehicles from the SUMO server."""
-    logger.info("Getting vehicles from SUMO server")
     try:
-        sumo = get_sumo_connection()
-        vehicles = sumo.get_vehicles()
-        logger.info(f"Retrieved vehicles: {vehicles}")
+        vehicles = await _submit("get_vehicles")
+        _debug("vehicles=%s", vehicles)
         return vehicles
     except Exception as e:
         logger.error(f"Failed to get vehicles from SUMO server: {e}")
         raise
 
-@mcp.tool()
-def get_vehicle_speed(ctx: Context, vehicle_id: str) -> float:
-    """Get the speed of a specific vehicle."""
-    logger.info(f"Getting speed for vehicle {vehicle_id}")
-    try:
-        sumo = get_sumo_connection()
-        speed = sumo.get_vehicle_speed(vehicle_id)
-        logger.info(f"Retrieved speed for vehicle {vehicle_id}: {speed}")
-        return speed
-    except Exception as e:
-        logger.error(f"Failed to get speed for vehicle {vehicle_id}: {e}")
-        raise
+# int16 snapshot payloads carry centimetres / centimetres-per-second.
+_QUANT_SCALE = 0.01
 
-@mcp.tool()
-def get_vehicle_position(ctx: Context, vehicle_id: str) -> List[float]:
-    """Get the position of a specific vehicle."""
-    logger.info(f"Getting position for vehicle {vehicle_id}")
-    try:
-        sumo = get_sumo_connection()
-        position = sumo.get_vehicle_position(vehicle_id)
-        logger.info(f"Retrieved position for vehicle {vehicle_id}: {position}")
-        return position
-    except Exception as e:
-        logger.error(f"Failed to get position for vehicle {vehicle_id}: {e}")
-        raise
+def _json_dumps(obj: Any) -> str:
+    """Serialize a tool response, preferring orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(obj)
 
-@mcp.tool()
-def get_vehicle_acceleration(ctx: Context, vehicle_id: str) -> float:
-    """Get the acceleration of a specific vehicle."""
-    logger.info(f"Getting acceleration for vehicle {vehicle_id}")
-    try:
-        sumo = get_sumo_connection()
-        acceleration = sumo.get_vehicle_acceleration(vehicle_id)
-        logger.info(f"Retrieved acceleration for vehicle {vehicle_id}: {acceleration}")
-        return acceleration
-    except Exception as e:
-        logger.error(f"Failed to get acceleration for vehicle {vehicle_id}: {e}")
-        raise
+def _encode_array(arr: "np.ndarray", dtype: str) -> Any:
+    """Pack a snapshot array for transport.
 
-@mcp.tool()
-def get_vehicle_lane(ctx: Context, vehicle_id: str) -> str:
-    """Get the lane of a specific vehicle."""
-    logger.info(f"Getting lane for vehicle {vehicle_id}")
-    try:
-        sumo = get_sumo_connection()
-        lane = sumo.get_vehicle_lane(vehicle_id)
-        logger.info(f"Retrieved lane for vehicle {vehicle_id}: {lane}")
-        return lane
-    except Exception as e:
-        logger.error(f"Failed to get lane for vehicle {vehicle_id}: {e}")
-        raise
+    "fp32" returns the raw array (orjson serializes it natively) or a plain
+    list; "fp16" and "int16" base64-encode the raw buffer, halving/quartering
+    the payload for bandwidth-bound consumers at negligible precision loss
+    for vehicle speeds and positions.
+    """
+    if dtype == "fp32":
+        return arr if orjson is not None else arr.tolist()
+    if dtype == "fp16":
+        packed = arr.astype(np.float16)
+        return {"dtype": "fp16", "scale": 1.0,
+                "data": base64.b64encode(packed.tobytes()).decode("ascii")}
+    if dtype == "int16":
+        info = np.iinfo(np.int16)
+        # Widen the cm default per array when values would not fit: network
+        # coordinates routinely exceed the ±327.67 the fixed scale covers,
+        # and int16 conversion wraps silently instead of saturating.
+        limit = float(np.max(np.abs(arr))) if arr.size else 0.0
+        scale = max(_QUANT_SCALE, limit / info.max)
+        packed = np.clip(np.round(arr / scale), info.min, info.max).astype(np.int16)
+        return {"dtype": "int16", "scale": scale,
+                "data": base64.b64encode(packed.tobytes()).decode("ascii")}
+    raise ValueError(f"Unsupported snapshot dtype: {dtype}")
 
 @mcp.tool()
-def get_vehicle_route(ctx: Context, vehicle_id: str) -> List[str]:
-    """Get the route of a specific vehicle."""
-    logger.info(f"Getting route for vehicle {vehicle_id}")
+async def get_fleet_snapshot(ctx: Context, dtype: str = "fp32") -> str:
+    """Get speed, position and acceleration for every vehicle in one call.
+
+    Returns a JSON object. dtype selects the transport encoding: "fp32"
+    (plain arrays), or "fp16" / "int16" for base64-packed quantized arrays
+    (int16 values are scaled by the returned "scale" factor).
+    """
     try:
-        sumo = get_sumo_connection()
-        route = sumo.get_vehicle_route(vehicle_id)
-        logger.info(f"Retrieved route for vehicle {vehicle_id}: {route}")
-        return route
+        snapshot = await _submit("get_fleet_snapshot")
+        return _json_dumps({
+            "ids": snapshot["ids"],
+            "speed": _encode_array(snapshot["speed"], dtype),
+            "x": _encode_array(snapshot["x"], dtype),
+            "y": _encode_array(snapshot["y"], dtype),
+            "accel": _encode_array(snapshot["accel"], dtype),
+        })
     except Exception as e:
-        logger.error(f"Failed to get route for vehicle {vehicle_id}: {e}")
+        logger.error(f"Failed to get fleet snapshot: {e}")
         raise
 
 @mcp.tool()
-def get_vehicle_route_edges(ctx: Context, vehicle_id: str) -> List[str]:
-    """Get the route edges of a specific vehicle."""
-    logger.info(f"Getting route edges for vehicle {vehicle_id}")
+async def detect_congestion(ctx: Context, eps: float = 1.0,
+                            eta: float = 0.5) -> Dict[str, Any]:
+    """Flag vehicles that barely moved and stayed slow over recent snapshots.
+
+    eps is the maximum x-extent in metres and eta the maximum peak speed in
+    m/s for a vehicle to count as congested across the buffered window.
+    """
     try:
-        sumo = get_sumo_connection()
-        route_edges = sumo.get_vehicle_route_edges(vehicle_id)
-        logger.info(f"Retrieved route edges for vehicle {vehicle_id}: {route_edges}")
-        return route_edges
+        return await _submit("detect_congestion", eps, eta)
     except Exception as e:
-        logger.error(f"Failed to get route edges for vehicle {vehicle_id}: {e}")
+        logger.error(f"Failed to detect congestion: {e}")
         raise
 
+def _make_vehicle_tool(name: str, doc: str, return_type):
+    """Register one per-vehicle tool that proxies through the batch queue."""
+    async def tool(ctx: Context, vehicle_id: str):
+        return await _submit(name, vehicle_id)
+    tool.__name__ = name
+    tool.__doc__ = doc
+    tool.__annotations__["return"] = return_type
+    return mcp.tool()(tool)
+
+for _name, _doc, _rtype in (
+    ("get_vehicle_speed", "Get the speed of a specific vehicle.", float),
+    ("get_vehicle_position", "Get the position of a specific vehicle.", Tuple[float, float]),
+    ("get_vehicle_acceleration", "Get the acceleration of a specific vehicle.", float),
+    ("get_vehicle_lane", "Get the lane of a specific vehicle.", str),
+    ("get_vehicle_route", "Get the route of a specific vehicle.", List[str]),
+    ("get_vehicle_route_edges", "Get the route edges of a specific vehicle.", List[str]),
+):
+    _make_vehicle_tool(_name, _doc, _rtype)
+
 def main():
     """Run the MCP server"""
     mcp.run()